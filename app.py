@@ -1,6 +1,16 @@
+import asyncio
+import json
+import string
+import threading
+import time
+import uuid
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from snowflake.connector.errors import OperationalError
 from snowflake.snowpark.context import get_active_session
+from snowflake.cortex import complete
 import pandas as pd
+import numpy as np
 
 # Streamlit page configuration
 st.set_page_config(page_title="Prostate Cancer Exploration Assistant")
@@ -10,8 +20,15 @@ This app retrieves documents using Cortex AI for retrieval. It generates insight
 using the Mistral LLM for exploring resistance mechanisms in prostate cancer, particularly AR-V7.
 """)
 
-# Initialize Snowflake session
-session = get_active_session()
+# Initialize Snowflake session once and reuse it across reruns
+@st.cache_resource
+def get_session():
+    """
+    Resolve the active Snowpark session a single time instead of on every rerun.
+    """
+    return get_active_session()
+
+session = get_session()
 
 # Database and table configurations
 DATABASE = "RESISTANCE_MECHANISM_ANALYSIS_DB"
@@ -20,27 +37,172 @@ DOCUMENTS_TABLE = "DOCUMENTS"
 INSIGHTS_TABLE = "INSIGHTS"
 FEEDBACK_TABLE = "FEEDBACKLOGS"
 QUERIES_TABLE = "QUERIES"
+EMBEDDINGS_TABLE = "EMBEDDINGS"
+FEEDBACK_VIEW = "FEEDBACK_WITH_INSIGHTS"
+QUERIES_SEQUENCE = "QUERIES_SEQ"
+INSIGHTS_SEQUENCE = "INSIGHTS_SEQ"
 NUM_CHUNKS = 3  # Number of chunks retrieved for context
+MAX_CHUNK_CHARS = 4000  # Max characters kept from each retrieved document
+MAX_CONTEXT_CHARS = 16000  # Prompt context budget (~4k tokens at ~4 chars/token)
+INSIGHT_CACHE_SIZE = 500  # Max insights kept in the per-session semantic cache
+EMBEDDING_DIM = 768  # Dimension of Cortex EMBED_TEXT_768 vectors
+INSIGHT_CACHE_THRESHOLD = 0.92  # Cosine similarity required for a cache hit
+INSIGHT_CACHE_CANDIDATES = 3  # Max nearest cached requests judged per lookup
+INSIGHT_CACHE_PREWARM = 50  # Recent logged insights loaded into a new session's cache
+INSIGHT_ERROR_PREFIX = "Error generating insights:"  # Marks a failed generation
+NO_RESPONSE_TEXT = "No response generated."  # Returned when COMPLETE yields nothing
+FEEDBACK_PAGE_SIZE = 100  # Feedback log rows shown per page
+CORTEX_RETRY_ATTEMPTS = 2  # Attempts per Cortex search on transient connection errors
+CORTEX_RETRY_WAIT = 0.1  # Base backoff in seconds between Cortex search attempts
+CORTEX_BREAKER_FAILURES = 3  # Failures within the window that open the circuit breaker
+CORTEX_BREAKER_WINDOW = 60  # Circuit breaker window in seconds
+DOCUMENT_CACHE_TTL = 3600  # Seconds a document search result is reused for the same query
+DOCUMENT_CACHE_SIZE = 256  # Max query texts kept per document search cache
+
+# Static part of the Mistral prompt, kept first so it forms a cacheable common prefix
+PROMPT_PREFIX = (
+    "You are an expert assistant providing insights based on the context supplied by the user.\n"
+    "Question: What are the key resistance mechanisms in prostate cancer related to AR-V7 "
+    "and other therapies?"
+)
+PROMPT_TEMPLATE = string.Template("Context: $context\nAnswer:")
+
+# SQL statements, built once from the configuration above
+DOCUMENTS = f"{DATABASE}.{SCHEMA}.{DOCUMENTS_TABLE}"
+INSIGHTS = f"{DATABASE}.{SCHEMA}.{INSIGHTS_TABLE}"
+FEEDBACK = f"{DATABASE}.{SCHEMA}.{FEEDBACK_TABLE}"
+QUERIES = f"{DATABASE}.{SCHEMA}.{QUERIES_TABLE}"
+EMBEDDINGS = f"{DATABASE}.{SCHEMA}.{EMBEDDINGS_TABLE}"
+QUERIES_SEQ = f"{DATABASE}.{SCHEMA}.{QUERIES_SEQUENCE}"
+INSIGHTS_SEQ = f"{DATABASE}.{SCHEMA}.{INSIGHTS_SEQUENCE}"
+SQL_FETCH_CORTEX = f"""
+    SELECT snowflake.cortex.search(
+        model_name => 'mistral-search',
+        query => ?,
+        data_table => '{DOCUMENTS}',
+        fields => ARRAY['CONTENT', 'TITLE'],
+        top_k => {NUM_CHUNKS}
+    ) AS DOCUMENTS;
+"""
+SQL_FETCH_CONTAINS = f"""
+    SELECT TITLE, CONTENT, QUERYID
+    FROM {DOCUMENTS}
+    WHERE CONTAINS(CONTENT, ?)
+    LIMIT {NUM_CHUNKS};
+"""
+# Embedding statements take a `{values}` list of row placeholders, filled per batch
+SQL_LOOKUP_EMBEDDINGS = f"""
+    SELECT T.CONTENT, E.EMBEDDING
+    FROM (VALUES {{values}}) AS T(CONTENT)
+    JOIN {EMBEDDINGS} E
+    ON E.CONTENT_SHA256 = SHA2_BINARY(T.CONTENT, 256);
+"""
+SQL_EMBED_BATCH = """
+    SELECT T.CONTENT, snowflake.cortex.embed_text_768('e5-base-v2', T.CONTENT) AS EMBEDDING
+    FROM (VALUES {values}) AS T(CONTENT);
+"""
+SQL_INSERT_EMBEDDINGS = f"""
+    INSERT INTO {EMBEDDINGS} (CONTENT_SHA256, EMBEDDING, CREATEDAT)
+    SELECT SHA2_BINARY(T.CONTENT, 256),
+           PARSE_JSON(T.EMBEDDING)::ARRAY::VECTOR(FLOAT, 768),
+           CURRENT_TIMESTAMP()
+    FROM (VALUES {{values}}) AS T(CONTENT, EMBEDDING)
+    WHERE NOT EXISTS (
+        SELECT 1 FROM {EMBEDDINGS} E
+        WHERE E.CONTENT_SHA256 = SHA2_BINARY(T.CONTENT, 256)
+    );
+"""
+SQL_JUDGE = "SELECT snowflake.cortex.complete(?, PARSE_JSON(?), {'max_tokens': 1}) AS RESPONSE"
+SQL_PREWARM = f"""
+    SELECT Q.QUERYTEXT, I.INSIGHTTEXT
+    FROM {INSIGHTS} I
+    JOIN {QUERIES} Q
+    ON I.QUERYID = Q.QUERYID
+    WHERE NOT STARTSWITH(I.INSIGHTTEXT, '{INSIGHT_ERROR_PREFIX}')
+    AND I.INSIGHTTEXT <> '{NO_RESPONSE_TEXT}'
+    ORDER BY I.GENERATEDAT DESC
+    LIMIT {INSIGHT_CACHE_PREWARM};
+"""
+# ID-returning inserts take the `{id}` of a pre-allocated sequence value
+SQL_INSERT_QUERY = f"""
+    INSERT INTO {QUERIES} (QUERYID, QUERYTEXT, CREATEDAT, USERID)
+    VALUES ({{id}}, ?, CURRENT_TIMESTAMP(), ?);
+"""
+SQL_INSERT_INSIGHT = f"""
+    INSERT INTO {INSIGHTS}
+    (INSIGHTID, INSIGHTTEXT, QUERYID, GENERATEDAT)
+    VALUES ({{id}}, ?, ?, CURRENT_TIMESTAMP());
+"""
+SQL_INSERT_FEEDBACK = f"""
+    INSERT INTO {FEEDBACK}
+    (FEEDBACKDETAILS, FEEDBACKTYPE, INSIGHTID, LOGGEDAT)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP());
+"""
+SQL_FEEDBACK_LOGS = f"""
+    SELECT FEEDBACKDETAILS, FEEDBACKTYPE, INSIGHTTEXT, LOGGEDAT
+    FROM {DATABASE}.{SCHEMA}.{FEEDBACK_VIEW}
+    ORDER BY LOGGEDAT DESC
+    LIMIT {FEEDBACK_PAGE_SIZE} OFFSET ?;
+"""
+
+# Raised instead of calling Cortex while its circuit breaker is open
+class CortexUnavailable(Exception):
+    pass
+
+# Function to run the Cortex AI search, memoized per query text
+@st.cache_data(ttl=DOCUMENT_CACHE_TTL, max_entries=DOCUMENT_CACHE_SIZE, show_spinner=False)
+def search_documents_cortex(query_text, _failures):
+    """
+    Run the Cortex AI search for `query_text`. Errors propagate and are not cached.
+
+    The body only runs on a cache miss, so the circuit breaker (`_failures`, the
+    recent failure timestamps, excluded from the cache key) is checked and reset
+    here: cached answers are served while it is open and never close it.
+    """
+    if len(_failures) >= CORTEX_BREAKER_FAILURES:
+        raise CortexUnavailable()
+    data = session.sql(SQL_FETCH_CORTEX, params=[query_text]).collect()
+    _failures.clear()
+    return [row["DOCUMENTS"] for row in data]
+
+# Function to run the CONTAINS search, memoized per query text
+@st.cache_data(ttl=DOCUMENT_CACHE_TTL, max_entries=DOCUMENT_CACHE_SIZE, show_spinner=False)
+def search_documents_sql(query_text):
+    """
+    Run the CONTAINS full-text search for `query_text`. Errors propagate and are not cached.
+    """
+    rows = session.sql(SQL_FETCH_CONTAINS, params=[query_text]).collect()
+    return [
+        {"TITLE": row["TITLE"], "CONTENT": row["CONTENT"], "QUERYID": row["QUERYID"]}
+        for row in rows
+    ]
 
 # Function to fetch documents via Cortex AI search
 def fetch_documents_cortex(query_text):
     """
     Fetch documents using Cortex AI search.
+
+    Transient connection errors are retried with exponential backoff. After
+    CORTEX_BREAKER_FAILURES failed searches within CORTEX_BREAKER_WINDOW seconds
+    uncached searches are skipped, so callers go straight to the SQL fallback.
     """
-    try:
-        sql = f"""
-            SELECT snowflake.cortex.search(
-                model_name => 'mistral-search',
-                query => ?,
-                data_table => '{DATABASE}.{SCHEMA}.{DOCUMENTS_TABLE}',
-                fields => ARRAY['CONTENT', 'TITLE'],
-                top_k => {NUM_CHUNKS}
-            ) AS DOCUMENTS;
-        """
-        data = session.sql(sql, params=[query_text]).collect()
-        return [row["DOCUMENTS"] for row in data] if data else []
-    except Exception:
-        return []  
+    now = time.monotonic()
+    failures = st.session_state.setdefault("cortex_failures", [])
+    failures[:] = [t for t in failures if now - t < CORTEX_BREAKER_WINDOW]
+    for attempt in range(CORTEX_RETRY_ATTEMPTS):
+        try:
+            return search_documents_cortex(query_text, failures)
+        except CortexUnavailable:
+            return []
+        except OperationalError:
+            if attempt + 1 < CORTEX_RETRY_ATTEMPTS:
+                time.sleep(CORTEX_RETRY_WAIT * 2 ** attempt)
+                continue
+        except Exception:
+            pass
+        break
+    failures.append(time.monotonic())
+    return []
 
 # Function to fetch documents directly via SQL query
 def fetch_documents_sql(query_text):
@@ -48,39 +210,309 @@ def fetch_documents_sql(query_text):
     Fetch documents using full-text search with CONTAINS.
     """
     try:
-        sql = f"""
-            SELECT TITLE, CONTENT, QUERYID
-            FROM {DATABASE}.{SCHEMA}.{DOCUMENTS_TABLE}
-            WHERE CONTAINS(CONTENT, ?)
-            LIMIT {NUM_CHUNKS};
-        """
-        data = session.sql(sql, params=[query_text]).to_pandas()
-        return data.to_dict("records") if not data.empty else []
+        return search_documents_sql(query_text)
     except Exception as e:
         st.error(f"Error fetching documents using SQL search: {e}")
         return []
 
-# Function to generate insights using Mistral LLM
-def generate_insights(context):
+# Function to run a blocking Snowflake call on a worker thread
+async def run_in_thread(func, *args):
     """
-    Generate insights using the Snowflake Cortex Mistral LLM `COMPLETE` function.
+    Await `func(*args)` via `asyncio.to_thread`. The Snowflake connector has no native
+    async API; the Streamlit script context is attached so `st` calls still work.
     """
-    if not context.strip():
-        return "No valid context provided for generating insights."
-    prompt = f"""
-    You are an expert assistant providing insights based on the following context:
-    Context: {context}
-    Question: What are the key resistance mechanisms in prostate cancer related to AR-V7 and other therapies?
-    Answer:
+    ctx = get_script_run_ctx()
+
+    def call():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return func(*args)
+
+    return await asyncio.to_thread(call)
+
+# Function to run a Snowflake call without waiting for it to finish
+def run_in_background(func, *args):
+    """
+    Start `func(*args)` on a daemon thread so the UI can render before it completes.
+    The script run has usually ended by then, so `func` must not draw `st.*` elements;
+    it may only record results in `st.session_state`.
     """
+    thread = threading.Thread(target=func, args=args, daemon=True)
+    add_script_run_ctx(thread)
+    thread.start()
+
+# Function to build the LLM context from retrieved documents
+def build_context(documents):
+    """
+    Join document contents into a prompt context, dropping empty and duplicate
+    passages (order preserved) and trimming each one to MAX_CHUNK_CHARS.
+    """
+    contents = dict.fromkeys(
+        doc["CONTENT"][:MAX_CHUNK_CHARS] for doc in documents if doc.get("CONTENT")
+    )
+    return "\n".join(contents)
+
+# Function to persist newly computed embeddings for reuse across sessions
+def store_embeddings(embeddings):
+    """
+    Insert `{content: embedding}` pairs into the EMBEDDINGS table, skipping
+    content whose SHA-256 is already present.
+    """
+    values = ", ".join(["(?, ?)"] * len(embeddings))
+    params = []
+    for content, embedding in embeddings.items():
+        params += [content, json.dumps([float(x) for x in embedding])]
+    try:
+        session.sql(SQL_INSERT_EMBEDDINGS.format(values=values), params=params).collect()
+    except Exception:
+        pass
+
+# Function to embed a batch of texts for the semantic insight cache
+def embed_texts(texts):
+    """
+    Embed texts with Cortex `EMBED_TEXT_768` and return an (N, 768) matrix of
+    L2-normalized float32 vectors in input order, or None if embedding fails.
+
+    Embeddings persisted in the EMBEDDINGS table are reused; the remaining texts
+    are embedded in one batched statement and stored in the background.
+    """
+    unique = list(dict.fromkeys(texts))
+    try:
+        values = ", ".join(["(?)"] * len(unique))
+        rows = session.sql(SQL_LOOKUP_EMBEDDINGS.format(values=values), params=unique).collect()
+        embeddings = {row["CONTENT"]: row["EMBEDDING"] for row in rows}
+        missing = [text for text in unique if text not in embeddings]
+        if missing:
+            values = ", ".join(["(?)"] * len(missing))
+            rows = session.sql(SQL_EMBED_BATCH.format(values=values), params=missing).collect()
+            computed = {row["CONTENT"]: row["EMBEDDING"] for row in rows}
+            embeddings.update(computed)
+            run_in_background(store_embeddings, computed)
+        vectors = np.asarray([embeddings[text] for text in texts], dtype=np.float32)
+    except Exception:
+        return None
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+# Function to embed a single text for the semantic insight cache
+def embed_text(text):
+    """
+    Embed text and return an L2-normalized float32 vector, or None on failure.
+    """
+    vectors = embed_texts([text])
+    return None if vectors is None else vectors[0]
+
+# Function to ask Mistral whether two requests share the same information need
+def is_same_information_need(cached_text, request_text):
+    """
+    Judge a cache candidate with a 1-token Cortex `COMPLETE` call. Embeddings alone
+    confuse requests that look alike but ask different things, so only a "Y"
+    verdict allows the cached insight to be served. Each request is truncated so
+    the whole judge prompt stays within MAX_CONTEXT_CHARS.
+    """
+    cached_text = cached_text[:MAX_CONTEXT_CHARS // 2]
+    request_text = request_text[:MAX_CONTEXT_CHARS // 2]
+    messages = [{
+        "role": "user",
+        "content": (
+            "Do these two requests have the same information need? Answer Y or N.\n"
+            f"Request A: {cached_text}\nRequest B: {request_text}"
+        ),
+    }]
     try:
-        query = """
-            SELECT snowflake.cortex.complete(?, ?) AS response
+        result = session.sql(
+            SQL_JUDGE, params=["mistral-large2", json.dumps(messages)]
+        ).collect()
+        verdict = json.loads(result[0]["RESPONSE"])["choices"][0]["messages"]
+        return verdict.strip().upper().startswith("Y")
+    except Exception:
+        return False
+
+# Semantic insight cache backed by a contiguous embedding matrix
+class InsightCache:
+    """
+    Fixed-capacity cache of `(embedding, request text, insight)` entries. Embeddings
+    live in one contiguous (capacity, EMBEDDING_DIM) float32 matrix, so scoring every
+    entry is a single SGEMV call; request texts and insights are kept in parallel
+    lists. When full, the least recently used row is overwritten.
+
+    Rows are not quantized to int8: NumPy has no int8 dot kernel, so every scan would
+    upcast the whole matrix to a temporary float32 copy, to save ~1 MB per session.
+    """
+
+    def __init__(self, capacity=INSIGHT_CACHE_SIZE):
+        self.mat = np.empty((capacity, EMBEDDING_DIM), dtype=np.float32)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.requests = []
+        self.responses = []
+        self.n = 0
+        self.clock = 0
+
+    def similarities(self, embedding):
+        """
+        Return the cosine similarity of `embedding` to every cached entry.
+        """
+        # A single vectorized product: a parallel JIT kernel (e.g. Numba prange) only
+        # wins beyond ~1000 rows, above INSIGHT_CACHE_SIZE, and costs a cold-start compile
+        return self.mat[:self.n] @ embedding
+
+    def touch(self, i):
+        """
+        Mark entry `i` as the most recently used.
+        """
+        self.clock += 1
+        self.last_used[i] = self.clock
+
+    def add(self, embedding, request_text, response):
         """
-        result = session.sql(query, params=["mistral-large2", prompt]).collect()
-        return result[0]["RESPONSE"] if result else "No response generated."
+        Store an entry, overwriting the least recently used one when full.
+        """
+        if self.n < len(self.mat):
+            i = self.n
+            self.n += 1
+            self.requests.append(request_text)
+            self.responses.append(response)
+        else:
+            i = int(np.argmin(self.last_used))
+            self.requests[i] = request_text
+            self.responses[i] = response
+        self.mat[i] = embedding
+        self.touch(i)
+
+# Function to look up a previously generated insight for an equivalent request
+def lookup_cached_insight(embedding, request_text):
+    """
+    Return the cached insight for a request equivalent to `request_text`, or None.
+    The nearest INSIGHT_CACHE_CANDIDATES entries above INSIGHT_CACHE_THRESHOLD are
+    retrieved by cosine similarity and judged nearest first; the first one the
+    judge confirms is served.
+    """
+    cache = st.session_state.get("insight_cache")
+    if cache is None or not cache.n:
+        return None
+    similarities = cache.similarities(embedding)
+    candidates = np.argsort(similarities)[::-1][:INSIGHT_CACHE_CANDIDATES]
+    candidates = [int(i) for i in candidates if similarities[i] >= INSIGHT_CACHE_THRESHOLD]
+    for i in candidates:
+        if is_same_information_need(cache.requests[i], request_text):
+            cache.touch(i)
+            return cache.responses[i]
+    return None
+
+# Function to add a generated insight to the semantic insight cache
+def cache_insight(embedding, request_text, response):
+    """
+    Store an insight in the session cache, evicting the least recently used entry.
+    """
+    if "insight_cache" not in st.session_state:
+        st.session_state["insight_cache"] = InsightCache()
+    st.session_state["insight_cache"].add(embedding, request_text, response)
+
+# Function to pre-warm the semantic insight cache from logged insights
+def prewarm_insight_cache():
+    """
+    Seed a new session's cache with the most recent logged insights and their queries.
+    The queries are embedded as one batch, mostly served from the EMBEDDINGS table.
+    """
+    if "insight_cache" in st.session_state:
+        return
+    st.session_state["insight_cache"] = InsightCache()
+    try:
+        rows = session.sql(SQL_PREWARM).collect()
+    except Exception:
+        return
+    if not rows:
+        return
+    vectors = embed_texts([row["QUERYTEXT"] for row in rows])
+    if vectors is None:
+        return
+    for row, vector in reversed(list(zip(rows, vectors))):
+        cache_insight(vector, row["QUERYTEXT"], row["INSIGHTTEXT"])
+
+# Function to generate insights using Mistral LLM
+def generate_insights(context, query_text=None, embedding=None):
+    """
+    Generate insights using the Snowflake Cortex Mistral LLM `COMPLETE` function,
+    yielding the response as it streams in so it can be rendered progressively.
+
+    Requests are keyed by the query text (or the context itself when the user
+    pasted their own), so paraphrased resubmissions are served from the cache.
+    Pass `embedding` when the request has already been embedded.
+    """
+    if not context.strip():
+        yield "No valid context provided for generating insights."
+        return
+    request_text = query_text or context
+    if embedding is None:
+        embedding = embed_text(request_text)
+    if embedding is not None:
+        cached = lookup_cached_insight(embedding, request_text)
+        if cached is not None:
+            yield cached
+            return
+    context = context[:MAX_CONTEXT_CHARS]
+    prompt = [
+        {"role": "system", "content": PROMPT_PREFIX},
+        {"role": "user", "content": PROMPT_TEMPLATE.substitute(context=context)},
+    ]
+    chunks = []
+    try:
+        for chunk in complete("mistral-large2", prompt, session=session, stream=True):
+            chunks.append(chunk)
+            yield chunk
     except Exception as e:
-        return f"Error generating insights: {e}"
+        yield f"{INSIGHT_ERROR_PREFIX} {e}"
+        return
+    response = "".join(chunks)
+    if not response:
+        yield NO_RESPONSE_TEXT
+        return
+    if embedding is not None:
+        cache_insight(embedding, request_text, response)
+
+# Function to tell a failed generation apart from a real insight
+def is_failed_insight(insight_text):
+    """
+    Return True for empty output, the no-response message, or any output that
+    contains the generation error message (including failures mid-stream).
+    """
+    return (
+        not insight_text
+        or insight_text == NO_RESPONSE_TEXT
+        or INSIGHT_ERROR_PREFIX in insight_text
+    )
+
+# Function to run an INSERT with a freshly allocated ID in one round trip
+def insert_returning_id(sequence, insert_query, params):
+    """
+    Snowflake has no `INSERT ... RETURNING`, so allocate the ID from `sequence` into
+    a session variable, INSERT it and read it back in a single multi-statement
+    request. Unlike reading back `MAX(ID)`, concurrent inserts of the same row can't
+    receive the same ID. The variable name is unique per call because every
+    Streamlit session shares one Snowpark session.
+    """
+    variable = f"NEW_ID_{uuid.uuid4().hex.upper()}"
+    sql = "\n".join([
+        f"SET {variable} = (SELECT {sequence}.NEXTVAL);",
+        insert_query.format(id=f"${variable}"),
+        f"SELECT ${variable};",
+        f"UNSET {variable};",
+    ])
+    cursor = session.connection.cursor()
+    try:
+        cursor.execute(sql, params, num_statements=4)
+        cursor.nextset()
+        cursor.nextset()
+        row = cursor.fetchone()
+        return row[0] if row else None
+    except Exception:
+        # A failed statement aborts the request before its UNSET; drop the variable
+        # so it doesn't accumulate on the shared session
+        try:
+            cursor.execute(f"UNSET {variable};")
+        except Exception:
+            pass
+        raise
+    finally:
+        cursor.close()
 
 # Function to log the query and retrieve the QUERYID
 def log_query_and_get_query_id(query_text, user_id=1):
@@ -88,19 +520,7 @@ def log_query_and_get_query_id(query_text, user_id=1):
     Log the query into the QUERIES table and return the generated QUERYID.
     """
     try:
-        insert_query = f"""
-            INSERT INTO {DATABASE}.{SCHEMA}.{QUERIES_TABLE} (QUERYTEXT, CREATEDAT, USERID)
-            VALUES (?, CURRENT_TIMESTAMP(), ?);
-        """
-        session.sql(insert_query, params=[query_text, user_id]).collect()
-        
-        select_query = f"""
-            SELECT MAX(QUERYID) AS QUERYID
-            FROM {DATABASE}.{SCHEMA}.{QUERIES_TABLE}
-            WHERE QUERYTEXT = ? AND USERID = ?;
-        """
-        result = session.sql(select_query, params=[query_text, user_id]).collect()
-        return result[0]["QUERYID"] if result else None
+        return insert_returning_id(QUERIES_SEQ, SQL_INSERT_QUERY, [query_text, user_id])
     except Exception as e:
         st.error(f"Error logging query: {e}")
         return None
@@ -108,18 +528,31 @@ def log_query_and_get_query_id(query_text, user_id=1):
 # Function to log insights into the INSIGHTS table
 def log_insights(insight_text, query_id):
     """
-    Log the generated insights into the database INSIGHTS table.
+    Log the generated insights into the database INSIGHTS table and remember the
+    new INSIGHTID in session state, with its QUERYID, as the target for feedback.
+    Runs in the background, so the outcome is stored in `insight_log_status` for
+    the next script run to display.
     """
     try:
-        insert_query = f"""
-            INSERT INTO {DATABASE}.{SCHEMA}.{INSIGHTS_TABLE} 
-            (INSIGHTTEXT, QUERYID, GENERATEDAT) 
-            VALUES (?, ?, CURRENT_TIMESTAMP());
-        """
-        session.sql(insert_query, params=[insight_text, query_id]).collect()
-        st.success("Insights logged successfully!")
+        insight_id = insert_returning_id(
+            INSIGHTS_SEQ, SQL_INSERT_INSIGHT, [insight_text, query_id]
+        )
+        st.session_state["logged_insight"] = (query_id, insight_id)
+        st.session_state["insight_log_status"] = (True, "Insights logged successfully!")
     except Exception as e:
-        st.error(f"Error logging insights: {e}")
+        st.session_state["insight_log_status"] = (False, f"Error logging insights: {e}")
+
+# Function to log a query, retrieve its documents and embed it concurrently
+async def retrieve_for_query(query_text):
+    """
+    Overlap the independent Snowflake round trips for a new query and return
+    `(query_id, documents, embedding)` once all of them complete.
+    """
+    return await asyncio.gather(
+        run_in_thread(log_query_and_get_query_id, query_text),
+        run_in_thread(fetch_documents_cortex, query_text),
+        run_in_thread(embed_text, query_text),
+    )
 
 # Query input section
 query = st.text_input("Enter a query (e.g., 'AR-V7 resistance in prostate cancer'):",
@@ -132,12 +565,16 @@ custom_context = st.text_area(
 # Query logging and processing section
 if st.button("Fetch and Analyze"):
     if query or custom_context:
+        # Feedback may only target the insight generated by this run
+        st.session_state.pop("logged_insight", None)
+        st.session_state["displayed_query_id"] = None
+        context = ""
+        embedding = None
         if not custom_context:
-            query_id = log_query_and_get_query_id(query)
-            if query_id:
-                with st.spinner("Retrieving documents..."):
-                    # Try Cortex AI search first
-                    documents = fetch_documents_cortex(query)
+            with st.spinner("Retrieving documents..."):
+                # Log the query, try Cortex AI search and embed the query in parallel
+                query_id, documents, embedding = asyncio.run(retrieve_for_query(query))
+                if query_id:
                     if not documents:
                         # Silently fallback to SQL search
                         documents = fetch_documents_sql(query)
@@ -145,9 +582,7 @@ if st.button("Fetch and Analyze"):
                     if documents:
                         st.markdown("### Retrieved Documents")
                         st.json(documents)
-                        context = "\n".join(doc.get("CONTENT", "") for doc in documents)
-                    else:
-                        context = ""
+                        context = build_context(documents)
         else:
             # Use the user-provided context
             query_id = None
@@ -155,54 +590,67 @@ if st.button("Fetch and Analyze"):
         
         if context.strip():
             with st.spinner("Generating insights using Mistral LLM..."):
-                insights = generate_insights(context)
                 st.markdown("### Generated Insights")
-                st.write(insights)
-                if query_id:
-                    log_insights(insights, query_id)
+                insights = st.write_stream(generate_insights(
+                    context, None if custom_context else query, embedding
+                ))
+                if query_id and not is_failed_insight(insights):
+                    st.session_state["displayed_query_id"] = query_id
+                    # Render the insights without waiting for the INSERT
+                    run_in_background(log_insights, insights, query_id)
         else:
             st.warning("No valid context found or provided.")
     else:
         st.warning("Please enter a query or input your own context.")
 
+# Report the outcome of the last background insight log
+log_status = st.session_state.pop("insight_log_status", None)
+if log_status is not None:
+    logged, message = log_status
+    if logged:
+        st.success(message)
+    else:
+        st.error(message)
+
 # Feedback submission section
 feedback_text = st.text_area("Submit your feedback on the insights generated:")
 feedback_type = st.selectbox("Select feedback type:", ["Positive", "Negative", "Neutral"])
 if st.button("Submit Feedback"):
-    if feedback_text:
+    displayed_query_id = st.session_state.get("displayed_query_id")
+    logged_query_id, insight_id = st.session_state.get("logged_insight", (None, None))
+    if not feedback_text:
+        st.warning("Please provide feedback before submitting.")
+    elif displayed_query_id is None or logged_query_id != displayed_query_id:
+        # Pasted-context insights are never logged; query insights are saved in the background
+        st.warning(
+            "Feedback can only be attached to saved insights from a query. "
+            "If you just generated them, wait a moment and try again."
+        )
+    else:
+        # Written on submit rather than buffered: Streamlit has no session-end hook to
+        # flush session state, so buffered feedback from a closed tab would be lost
         try:
-            insight_id = session.sql(f"""
-                SELECT INSIGHTID FROM {DATABASE}.{SCHEMA}.{INSIGHTS_TABLE} 
-                ORDER BY GENERATEDAT DESC LIMIT 1;
-            """).collect()[0]["INSIGHTID"]
-            insert_query = f"""
-                INSERT INTO {DATABASE}.{SCHEMA}.{FEEDBACK_TABLE} 
-                (FEEDBACKDETAILS, FEEDBACKTYPE, INSIGHTID, LOGGEDAT) 
-                VALUES (?, ?, ?, CURRENT_TIMESTAMP());
-            """
-            session.sql(insert_query, params=[feedback_text, feedback_type, insight_id]).collect()
+            session.sql(
+                SQL_INSERT_FEEDBACK, params=[feedback_text, feedback_type, insight_id]
+            ).collect()
             st.success("Feedback submitted successfully!")
         except Exception as e:
             st.error(f"Error submitting feedback: {e}")
-    else:
-        st.warning("Please provide feedback before submitting.")
 
 # View feedback logs
+feedback_page = st.number_input("Feedback logs page:", min_value=1, value=1, step=1)
 if st.button("View Feedback Logs"):
     with st.spinner("Loading feedback logs..."):
         try:
-            sql = f"""
-                SELECT FL.FEEDBACKDETAILS, FL.FEEDBACKTYPE, I.INSIGHTTEXT, FL.LOGGEDAT
-                FROM {DATABASE}.{SCHEMA}.{FEEDBACK_TABLE} FL
-                JOIN {DATABASE}.{SCHEMA}.{INSIGHTS_TABLE} I 
-                ON FL.INSIGHTID = I.INSIGHTID
-                ORDER BY FL.LOGGEDAT DESC;
-            """
-            logs = session.sql(sql).to_pandas()
+            offset = (int(feedback_page) - 1) * FEEDBACK_PAGE_SIZE
+            logs = session.sql(SQL_FEEDBACK_LOGS, params=[offset]).to_pandas()
             if not logs.empty:
-                st.markdown("### Feedback Logs")
+                st.markdown(f"### Feedback Logs (page {int(feedback_page)})")
                 st.dataframe(logs)
             else:
                 st.write("No feedback records found.")
         except Exception as e:
             st.error(f"Error fetching feedback logs: {e}")
+
+# Seed the semantic cache once the page has rendered so new sessions see the UI first
+prewarm_insight_cache()